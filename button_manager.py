@@ -4,25 +4,49 @@ Handles the 4 MagTag buttons (D11-D15) for manual feeding status control
 """
 
 import board
+import keypad
 import time
-from digitalio import DigitalInOut, Direction, Pull
 from config import Config
 
+# NeoPixel color used to acknowledge a button press
+_FLASH_WHITE = (50, 50, 50)
+
+# Config values used on the press path, bound once at import
+_DEBUG = Config.DEBUG
+_PIXEL_COUNT = Config.PIXEL_COUNT
+_PIXEL_RED = Config.PIXEL_RED
+_PIXEL_GREEN = Config.PIXEL_GREEN
+_PIXEL_OFF = Config.PIXEL_OFF
+_MORNING_TOPIC = Config.MQTT_MORNING_TOPIC
+_EVENING_TOPIC = Config.MQTT_EVENING_TOPIC
+_PUBLISH_QOS = Config.MQTT_PUBLISH_QOS
+_PUBLISH_RETAIN = Config.MQTT_PUBLISH_RETAIN
+
 
 class ButtonManager:
     """Manages the 4 MagTag buttons for feeding control"""
 
     # Button pins on MagTag (left to right when viewing from front)
-    BUTTON_PINS = [board.D15, board.D14, board.D12, board.D11]
+    # BUTTON_A-D are the board aliases for D15, D14, D12, D11
+    BUTTON_PINS = (board.BUTTON_A, board.BUTTON_B, board.BUTTON_C, board.BUTTON_D)
 
-    # Button actions
+    # Button indices (documentation for the dispatch table in __init__)
     BUTTON_MORNING_FED = 0      # D15 - leftmost
     BUTTON_MORNING_CLEAR = 1   # D14
     BUTTON_EVENING_FED = 2     # D12
     BUTTON_EVENING_CLEAR = 3   # D11 - rightmost
 
-    # Debounce settings
-    DEBOUNCE_DELAY = 0.2  # seconds
+    # Debounce settings (keypad scan interval, events need a stable reading)
+    DEBOUNCE_DELAY = 0.02  # seconds
+
+    # Maximum number of publishes waiting to be sent
+    MAX_PENDING = 8
+
+    # How long the press acknowledgment flash stays lit
+    FLASH_DURATION = 0.1  # seconds
+
+    # Minimum time between error strobes (avoids stacking them during outages)
+    ERROR_FLASH_COOLDOWN = 2.0  # seconds
 
     def __init__(self, network_manager, display_manager):
         """
@@ -34,15 +58,47 @@ class ButtonManager:
         """
         self.network = network_manager
         self.display = display_manager
-        self.buttons = []
-        self.last_press_time = [0] * 4
+        self._pending = []  # Queued (topic, fed) publishes
+        self._snapshot = [None] * _PIXEL_COUNT  # Colors saved by _error_flash
+        self._last_error_flash = -self.ERROR_FLASH_COOLDOWN
+
+        # Pending press flash, settled by pump_flash()
+        self._flash_pixel = None
+        self._flash_restore = None
+        self._flash_deadline = 0
+
+        # Feedback pixel per button index
+        self._pixel_for_button = (
+            Config.MORNING_PIXEL,
+            Config.MORNING_PIXEL,
+            Config.EVENING_PIXEL,
+            Config.EVENING_PIXEL,
+        )
 
-        # Initialize buttons
-        for pin in self.BUTTON_PINS:
-            button = DigitalInOut(pin)
-            button.direction = Direction.INPUT
-            button.pull = Pull.UP
-            self.buttons.append(button)
+        # Status color each button leads to (fed = green, cleared = red)
+        self._color_for_button = (_PIXEL_GREEN, _PIXEL_RED, _PIXEL_GREEN, _PIXEL_RED)
+
+        # Log line per button index, formatted once instead of on every press
+        self._press_labels = tuple(
+            f"\nButton {i} pressed ({pin})" for i, pin in enumerate(self.BUTTON_PINS)
+        )
+
+        # Action per button index, in BUTTON_PINS order
+        self._actions = (
+            lambda: self._queue_publish(_MORNING_TOPIC, True, "morning"),
+            lambda: self._queue_publish(_MORNING_TOPIC, False, "morning"),
+            lambda: self._queue_publish(_EVENING_TOPIC, True, "evening"),
+            lambda: self._queue_publish(_EVENING_TOPIC, False, "evening"),
+        )
+
+        # Initialize buttons (active LOW, scanned and debounced in the background)
+        self.keys = keypad.Keys(
+            self.BUTTON_PINS,
+            value_when_pressed=False,
+            pull=True,
+            interval=self.DEBOUNCE_DELAY
+        )
+        self._event = keypad.Event()  # Reused for every events.get_into()
 
         print("ButtonManager initialized (4 buttons ready)")
         print("  D15: Morning Fed | D14: Morning Clear")
@@ -54,124 +110,130 @@ class ButtonManager:
 
         Returns: True if any button was pressed
         """
-        current_time = time.monotonic()
         button_pressed = False
+        event = self._event
 
-        for i, button in enumerate(self.buttons):
-            # Buttons are active LOW (pressed = False)
-            if not button.value:
-                # Check debounce
-                if current_time - self.last_press_time[i] > self.DEBOUNCE_DELAY:
-                    self.last_press_time[i] = current_time
-                    self._handle_button_press(i)
-                    button_pressed = True
-
-                    # Wait for button release to prevent repeat triggers
-                    while not button.value:
-                        time.sleep(0.01)
+        # Drain queued key events; only presses trigger actions
+        while self.keys.events.get_into(event):
+            if event.pressed:
+                self._handle_button_press(event.key_number)
+                button_pressed = True
 
         return button_pressed
 
     def _handle_button_press(self, button_index):
         """Handle a specific button press"""
-        print(f"\nButton {button_index} pressed (D{self.BUTTON_PINS[button_index]})")
+        if _DEBUG:
+            print(self._press_labels[button_index])
 
         # Flash the appropriate LED to indicate button press
         self._flash_feedback(button_index)
 
-        if button_index == self.BUTTON_MORNING_FED:
-            self._set_morning_fed()
-        elif button_index == self.BUTTON_MORNING_CLEAR:
-            self._clear_morning_fed()
-        elif button_index == self.BUTTON_EVENING_FED:
-            self._set_evening_fed()
-        elif button_index == self.BUTTON_EVENING_CLEAR:
-            self._clear_evening_fed()
+        self._actions[button_index]()
 
     def _flash_feedback(self, button_index):
-        """Provide visual feedback via NeoPixels"""
-        # Determine which pixel to flash based on button
-        if button_index in (self.BUTTON_MORNING_FED, self.BUTTON_MORNING_CLEAR):
-            pixel_index = Config.MORNING_PIXEL
-        else:
-            pixel_index = Config.EVENING_PIXEL
-
-        # Store current color
-        original_color = self.display.pixels[pixel_index]
-
-        # Quick flash (white -> original)
-        self.display.pixels[pixel_index] = (50, 50, 50)  # White flash
-        self.display.pixels.show()
-        time.sleep(0.1)
-        self.display.pixels[pixel_index] = original_color
-        self.display.pixels.show()
+        """Start a press acknowledgment flash (settled later by pump_flash)"""
+        # Finish any flash still in progress first
+        self._end_flash()
 
-    def _set_morning_fed(self):
-        """Publish morning fed status"""
-        print("Setting morning as FED")
-        success = self.network.publish_feeding_status(
-            Config.MQTT_MORNING_TOPIC,
-            fed=True
-        )
-        if success:
-            print("Morning fed status published")
-        else:
-            print("Failed to publish morning status")
-            self._error_flash()
+        pixel_index = self._pixel_for_button[button_index]
 
-    def _clear_morning_fed(self):
-        """Clear morning fed status"""
-        print("Clearing morning (NOT FED)")
-        success = self.network.publish_feeding_status(
-            Config.MQTT_MORNING_TOPIC,
-            fed=False
-        )
-        if success:
-            print("Morning cleared")
-        else:
-            print("Failed to clear morning status")
-            self._error_flash()
+        # When the flash ends, show the state this button sets rather than
+        # the old color; the next status update confirms or corrects it
+        self._flash_restore = self._color_for_button[button_index]
+        self._flash_pixel = pixel_index
+        self._flash_deadline = time.monotonic() + self.FLASH_DURATION
 
-    def _set_evening_fed(self):
-        """Publish evening fed status"""
-        print("Setting evening as FED")
-        success = self.network.publish_feeding_status(
-            Config.MQTT_EVENING_TOPIC,
-            fed=True
-        )
-        if success:
-            print("Evening fed status published")
-        else:
-            print("Failed to publish evening status")
-            self._error_flash()
+        self.display.pixels[pixel_index] = _FLASH_WHITE
+        self.display.pixels.show()
 
-    def _clear_evening_fed(self):
-        """Clear evening fed status"""
-        print("Clearing evening (NOT FED)")
-        success = self.network.publish_feeding_status(
-            Config.MQTT_EVENING_TOPIC,
-            fed=False
+    def pump_flash(self):
+        """Settle the flashed pixel once its deadline has passed"""
+        if self._flash_pixel is not None and time.monotonic() >= self._flash_deadline:
+            self._end_flash()
+
+    def _end_flash(self):
+        """Set the flashed pixel to its new status color"""
+        if self._flash_pixel is None:
+            return
+        self.display.pixels[self._flash_pixel] = self._flash_restore
+        self.display.pixels.show()
+        self._flash_pixel = None
+        self._flash_restore = None
+
+    def _queue_publish(self, topic, fed, name):
+        """Add a publish to the pending queue, coalescing repeats for a topic"""
+        if _DEBUG:
+            print(f"Setting {name} as {'FED' if fed else 'NOT FED'}")
+        pending = self._pending
+
+        # Latest state wins: overwrite a queued entry for the same topic
+        if pending and pending[-1][0] == topic:
+            pending[-1] = (topic, fed)
+            return
+
+        if len(pending) >= self.MAX_PENDING:
+            print("Publish queue full, dropping oldest entry")
+            pending.pop(0)
+        pending.append((topic, fed))
+
+    def pump(self):
+        """
+        Send one queued publish to the network
+
+        Called from the main loop so button handling never waits on MQTT.
+        Returns: True if a publish was attempted
+        """
+        if not self._pending:
+            return False
+
+        # While the client is reconnecting, keep publishes queued; the main
+        # loop reconnects and a later pump() sends them
+        network = self.network
+        if network.mqtt_client and not network.mqtt_connected:
+            return False
+
+        topic, fed = self._pending.pop(0)
+        success = network.publish_feeding_status(
+            topic,
+            fed=fed,
+            qos=_PUBLISH_QOS,
+            retain=_PUBLISH_RETAIN
         )
-        if success:
-            print("Evening cleared")
-        else:
-            print("Failed to clear evening status")
+        if not success:
+            print(f"Failed to publish to {topic}")
             self._error_flash()
+            # The LED already shows the requested state; let the next status
+            # fetch put it back even if the data hasn't changed
+            self.display.forget_status()
+        elif _DEBUG:
+            print(f"Published {'fed' if fed else 'not fed'} to {topic}")
+        return True
 
     def _error_flash(self):
-        """Flash red to indicate an error"""
+        """Flash red to indicate an error (rate limited)"""
+        now = time.monotonic()
+        if now - self._last_error_flash < self.ERROR_FLASH_COOLDOWN:
+            return
+        self._last_error_flash = now
+
+        # Don't snapshot a press flash as a status color
+        self._end_flash()
+
         # Flash all pixels red briefly
-        original_colors = [self.display.pixels[i] for i in range(Config.PIXEL_COUNT)]
+        snapshot = self._snapshot
+        for i in range(_PIXEL_COUNT):
+            snapshot[i] = self.display.pixels[i]
 
         for _ in range(3):
-            self.display.pixels.fill(Config.PIXEL_RED)
+            self.display.pixels.fill(_PIXEL_RED)
             self.display.pixels.show()
             time.sleep(0.1)
-            self.display.pixels.fill(Config.PIXEL_OFF)
+            self.display.pixels.fill(_PIXEL_OFF)
             self.display.pixels.show()
             time.sleep(0.1)
 
         # Restore original colors
-        for i, color in enumerate(original_colors):
-            self.display.pixels[i] = color
+        for i in range(_PIXEL_COUNT):
+            self.display.pixels[i] = snapshot[i]
         self.display.pixels.show()
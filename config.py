@@ -9,6 +9,16 @@ import os
 class Config:
     """Configuration settings for the dog feeding tracker"""
 
+    # Verbose logging on hot paths (serial writes block until the TX buffer drains)
+    DEBUG = False
+
+    # Run the network connectivity self-test at startup (set DEBUG_CONNECTIVITY = "1")
+    DEBUG_CONNECTIVITY = int(os.getenv("DEBUG_CONNECTIVITY", "0")) == 1
+
+    # Deep sleep between status fetches instead of staying awake for MQTT and
+    # buttons (set SLEEP_BETWEEN_FETCHES = "1"; lowest power, no live updates)
+    SLEEP_BETWEEN_FETCHES = int(os.getenv("SLEEP_BETWEEN_FETCHES", "0")) == 1
+
     # Time windows (24-hour format)
     MORNING_START = 7
     MORNING_END = 11
@@ -18,6 +28,12 @@ class Config:
     # Get API URL from settings.toml or use default
     DOG_FEED_STATUS_URL = os.getenv("DOG_FEED_API", "http://192.168.1.85:1880/dog-feed-status")
 
+    # MQTT broker settings from settings.toml (read once at import)
+    MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.85")
+    MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+    MQTT_USERNAME = os.getenv("MQTT_USERNAME")
+    MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
+
     # MQTT topics
     MQTT_MORNING_TOPIC = 'dog/fed/morning'
     MQTT_EVENING_TOPIC = 'dog/fed/evening'
@@ -26,21 +42,41 @@ class Config:
     # Set to empty string, "false", or whatever your backend expects
     MQTT_NOT_FED_PAYLOAD = os.getenv("MQTT_NOT_FED_PAYLOAD", "")
 
+    # Feeding status publishes: QoS 0 (no PUBACK wait), retained so the
+    # broker holds the last known state for new subscribers
+    MQTT_PUBLISH_QOS = 0
+    MQTT_PUBLISH_RETAIN = True
+
     # Timezone offset from UTC in hours (e.g., -5 for EST, -4 for EDT)
     # Used for converting between UTC (MQTT) and local time (display)
     TIMEZONE_OFFSET = int(os.getenv("TIMEZONE_OFFSET", "-5"))
 
+    # Set the clock from the status API's HTTP Date header, so the hourly
+    # sync only falls back to NTP when the API doesn't send one
+    HTTP_DATE_TIME_SYNC = True
+
     # Refresh intervals (seconds)
     TIME_SYNC_INTERVAL = 3600  # 1 hour
     STATUS_FETCH_INTERVAL = 300  # 5 minutes
-    DISPLAY_REFRESH_MIN_INTERVAL = 10  # Minimum time between display refreshes
-    MQTT_LOOP_TIMEOUT = 1.0  # MQTT loop timeout (must be >= socket timeout)
+    MQTT_SOCKET_TIMEOUT = 0.05  # MQTT socket poll interval
+    MQTT_RECV_TIMEOUT = 2  # MQTT wait for CONNACK/SUBACK (must be > socket timeout)
+    MQTT_LOOP_TIMEOUT = 0.05  # MQTT loop timeout (must be >= socket timeout)
+    MQTT_DRAIN_LIMIT = 8  # Max MQTT loop calls per pass while messages keep arriving
+    MAIN_LOOP_WAIT = 0.1  # Button polling window at the end of each main loop pass
+    BUTTON_POLL_INTERVAL = 0.02  # Button polling period within that window
+    SLEEP_CHECK_INTERVAL = 30  # How often to check the deep sleep schedule
+
+    # Run gc.collect() in the main loop only below this many free bytes
+    GC_FREE_THRESHOLD = 20000
 
     # Retry settings
     MAX_RETRIES = 3
-    RETRY_DELAY = 2
+    RETRY_BASE = 2  # Backoff window after the first failure, doubled per attempt
+    RETRY_CAP = 16  # Largest backoff window (actual wait is random within it)
+    RETRY_FAILURE_WEIGHT = 0.1  # Weight of the latest attempt in the failure rate average
     CONNECTION_FAILURE_THRESHOLD = 5
     HTTP_TIMEOUT = 5  # Reduced timeout for faster failures
+    HTTP_BUFFER_SIZE = 2048  # Status body buffer, allocated once (larger bodies are still read)
 
     # NeoPixel settings (MagTag has 4 NeoPixels)
     PIXEL_COUNT = 4
@@ -53,6 +89,10 @@ class Config:
     MORNING_PIXEL = 3  # Top right
     EVENING_PIXEL = 0  # Top left
 
+    # alarm.sleep_memory layout (survives deep sleep, cleared on power loss)
+    SLEEP_MEMORY_STATUS = 0  # Displayed status: 1 length byte + up to 255 bytes JSON
+    SLEEP_MEMORY_LAST_SYNC = 256  # time.time() of the last NTP sync: 4 bytes
+
     # Display resources
     BACKGROUND_BMP = "/images/background.bmp"
     BOWL_SPRITE_BMP = "/images/bowl_tile.bmp"
@@ -3,27 +3,86 @@ Display Manager for Dog Feeding Tracker
 Handles all e-ink display and NeoPixel operations
 """
 
+import json
 import time
+import alarm
 import board
 import displayio
 import terminalio
+import vectorio
 import neopixel
-import adafruit_imageload
-from adafruit_display_text import label
+from adafruit_display_text import bitmap_label
 from config import Config
 
+# Fixed label texts, allocated once
+_NOT_FED = "Not fed"
+_FED = "Fed"
+
+# Config values used on the status update path, bound once at import
+_DEBUG = Config.DEBUG
+_PIXEL_RED = Config.PIXEL_RED
+_PIXEL_GREEN = Config.PIXEL_GREEN
+_TIMEZONE_OFFSET = Config.TIMEZONE_OFFSET
+
+# 12-hour clock (display hour, period) for each local hour 0-23
+_HOUR_MAP = tuple((hour % 12 or 12, "AM" if hour < 12 else "PM") for hour in range(24))
+
+
+def _parse_time(timestamp_str):
+    """
+    Parse ISO8601 UTC timestamp and convert to local time in 12-hour format
+    Input: "2025-08-23T14:26:25Z" (UTC, always a non-empty str)
+    Output: "9:26 AM" (local time with timezone offset applied)
+    """
+    try:
+        if 'T' in timestamp_str:
+            if len(timestamp_str) >= 16 and timestamp_str[10] == 'T':
+                # Fixed-width "YYYY-MM-DDTHH:MM..." - slice HH and MM directly
+                utc_hour = int(timestamp_str[11:13])
+                minute = int(timestamp_str[14:16])
+            else:
+                # ISO8601 format - extract date and time parts
+                date_part, time_part = timestamp_str.split('T')
+                time_part = time_part.split('.')[0].split('Z')[0]  # Remove fractional seconds and Z
+
+                hour_str, minute_str = time_part.split(':')[:2]
+                utc_hour = int(hour_str)
+                minute = int(minute_str)
+
+            # Convert UTC to local time by adding timezone offset
+            # e.g., if offset is -5 (EST), local = UTC - 5
+            local_hour = utc_hour + _TIMEZONE_OFFSET
+
+            # Handle day boundary (we only care about hour for display)
+            if local_hour >= 24:
+                local_hour -= 24
+            elif local_hour < 0:
+                local_hour += 24
+
+            # Convert to 12-hour format with AM/PM
+            display_hour, period = _HOUR_MAP[local_hour]
+
+            return f"{display_hour}:{minute:02d} {period}"
+
+        # Fallback for non-ISO formats
+        return timestamp_str
+
+    except Exception as e:
+        print(f"Error parsing time '{timestamp_str}': {e}")
+        return timestamp_str
+
 
 class DisplayManager:
     """Manages the e-ink display and NeoPixel indicators"""
 
     def __init__(self):
         """Initialize display components"""
-        # NeoPixels
+        # NeoPixels (writes are batched, callers must call show())
         self.pixels = neopixel.NeoPixel(
             board.NEOPIXEL,
             Config.PIXEL_COUNT,
             brightness=Config.PIXEL_BRIGHTNESS,
-            auto_write=True
+            auto_write=False
         )
 
         # Display sprites and labels
@@ -32,14 +91,25 @@ class DisplayManager:
         self.evening_sprite = None
         self.evening_sprite_label = None
 
+        # (sprite, label, pixel index) per panel, morning first; sprites and
+        # labels are filled in by setup()
+        self._panels = (
+            (None, None, Config.MORNING_PIXEL),
+            (None, None, Config.EVENING_PIXEL),
+        )
+
         # Tracking
-        self.last_refresh = 0
         self.first_update = True
-
-        # Load bowl sprites
-        self.bowl_icon, self.bowl_icon_pal = adafruit_imageload.load(
-            Config.BOWL_SPRITE_BMP
-        )
+        self._last_status = None  # (morning, evening) last applied
+        self._shown_status = None  # (morning, evening) on the panel at last refresh
+        self._dirty = False  # Display objects changed since the last refresh
+        self._refreshed = False  # Panel refreshed since boot
+        self._fed_text = {}  # pixel index -> (timestamp, "Fed at ..." label)
+        self._label_text = {}  # pixel index -> text currently set on the label
+
+        # Bowl sprites are read from flash on demand rather than held in RAM
+        self.bowl_icon = displayio.OnDiskBitmap(Config.BOWL_SPRITE_BMP)
+        self.bowl_icon_pal = self.bowl_icon.pixel_shader
         print("Bowl sprites loaded successfully")
 
     def startup_animation(self):
@@ -49,31 +119,32 @@ class DisplayManager:
         # Ensure brightness is set correctly after wake
         self.pixels.brightness = Config.PIXEL_BRIGHTNESS
 
+        # Frame table of (pixel colors, hold time), built up front so playback
+        # is just one buffer copy and show() per frame
+        count = Config.PIXEL_COUNT
+        green = (Config.PIXEL_GREEN,) * count
+        off = (Config.PIXEL_OFF,) * count
+        frames = []
+
         # Quick green flash sequence
-        for i in range(3):
-            self.pixels.fill(Config.PIXEL_GREEN)
-            self.pixels.show()
-            time.sleep(0.2)
-            self.pixels.fill(Config.PIXEL_OFF)
-            self.pixels.show()
-            time.sleep(0.2)
+        for _ in range(3):
+            frames.append((green, 0.2))
+            frames.append((off, 0.2))
 
         # Chase animation around the 4 pixels
         for _ in range(2):
-            for i in range(4):
-                self.pixels.fill(Config.PIXEL_OFF)
-                self.pixels[i] = Config.PIXEL_GREEN
-                self.pixels.show()
-                time.sleep(0.1)
+            for i in range(count):
+                frames.append((off[:i] + green[i:i + 1] + off[i + 1:], 0.1))
 
         # Final flash
-        self.pixels.fill(Config.PIXEL_GREEN)
-        self.pixels.show()
-        time.sleep(0.3)
-        self.pixels.fill(Config.PIXEL_OFF)
-        self.pixels.show()
+        frames.append((green, 0.3))
+        frames.append((off, 0.5))
+
+        for colors, hold in frames:
+            self.pixels[:] = colors
+            self.pixels.show()
+            time.sleep(hold)
 
-        time.sleep(0.5)
         print("Startup animation complete")
 
     def setup(self):
@@ -105,8 +176,14 @@ class DisplayManager:
         main_group.append(morning_group)
         main_group.append(evening_group)
 
+        self._panels = (
+            (self.morning_sprite, self.morning_sprite_label, Config.MORNING_PIXEL),
+            (self.evening_sprite, self.evening_sprite_label, Config.EVENING_PIXEL),
+        )
+
         # Show on display
         board.DISPLAY.root_group = main_group
+        self._dirty = True
 
         # Set initial LED states
         self.pixels[Config.MORNING_PIXEL] = Config.PIXEL_RED
@@ -133,11 +210,13 @@ class DisplayManager:
         )
         group.append(sprite)
 
-        # Create text label
-        sprite_label = label.Label(
+        # Create text label (bitmap_label renders into one bitmap; with
+        # save_text=False it doesn't keep a copy of the text, we track it)
+        sprite_label = bitmap_label.Label(
             terminalio.FONT,
-            text="Not fed",
+            text=_NOT_FED,
             color=0x000000,
+            save_text=False,
             x=Config.TEXT_X_OFFSET + x_offset,
             y=Config.TEXT_Y_POSITION
         )
@@ -147,9 +226,11 @@ class DisplayManager:
         if is_morning:
             self.morning_sprite = sprite
             self.morning_sprite_label = sprite_label
+            self._label_text[Config.MORNING_PIXEL] = _NOT_FED
         else:
             self.evening_sprite = sprite
             self.evening_sprite_label = sprite_label
+            self._label_text[Config.EVENING_PIXEL] = _NOT_FED
 
         return group
 
@@ -158,9 +239,11 @@ class DisplayManager:
         white_palette = displayio.Palette(1)
         white_palette[0] = 0xFFFFFF  # White
 
-        white_bg = displayio.TileGrid(
-            displayio.Bitmap(Config.DISPLAY_WIDTH, Config.DISPLAY_HEIGHT, 1),
+        # A filled shape needs no bitmap memory, unlike a full-screen Bitmap
+        white_bg = vectorio.Rectangle(
             pixel_shader=white_palette,
+            width=Config.DISPLAY_WIDTH,
+            height=Config.DISPLAY_HEIGHT,
             x=0,
             y=0
         )
@@ -171,16 +254,16 @@ class DisplayManager:
         Update display based on feeding status
         Returns: True if display was refreshed
         """
-        display_changed = False
-
-        # Update morning
-        display_changed |= self._update_morning(morning_status)
-
-        # Update evening
-        display_changed |= self._update_evening(evening_status)
+        # Periodic polls usually return identical data, skip all the work
+        status = (morning_status, evening_status)
+        if status == self._last_status and not self.first_update and not force_refresh:
+            if _DEBUG:
+                print("Status unchanged, skipping update")
+            return False
+        self._last_status = status
 
-        # Update pixels
-        self.pixels.show()
+        # Update morning and evening panels
+        display_changed = self._apply(status)
 
         # Refresh display if needed
         if self.first_update:
@@ -192,148 +275,148 @@ class DisplayManager:
             self.refresh_display()
             return True
         else:
-            print("No display changes, skipping refresh")
+            if _DEBUG:
+                print("No display changes, skipping refresh")
             return False
 
-    def _update_morning(self, status):
-        """Update morning display and return True if changed"""
+    def _apply(self, status):
+        """Apply a (morning, evening) status to both panels and the LEDs"""
+        changed = False
+        panels = self._panels
+        for i in range(2):
+            sprite, sprite_label, pixel_index = panels[i]
+            changed |= self._update_panel(status[i], sprite, sprite_label, pixel_index)
+        self.pixels.show()
+        return changed
+
+    def _update_panel(self, status, sprite, sprite_label, pixel_index):
+        """Update one panel's bowl, label, and LED; return True if changed"""
         changed = False
 
         if status:
             # Fed - green light, filled bowl
-            self.pixels[Config.MORNING_PIXEL] = Config.PIXEL_GREEN
-
-            if self.morning_sprite and self.morning_sprite[0] != 1:
-                self.morning_sprite[0] = 1
-                changed = True
-
-            if self.morning_sprite_label:
-                new_text = f"Fed at {self._parse_time(status)}" if status != True else "Fed"
-                if self.morning_sprite_label.text != new_text:
-                    self.morning_sprite_label.text = new_text
-                    changed = True
+            self.pixels[pixel_index] = _PIXEL_GREEN
+            tile = 1
+            new_text = self._fed_label(status, pixel_index)
         else:
             # Not fed - red light, empty bowl
-            self.pixels[Config.MORNING_PIXEL] = Config.PIXEL_RED
+            self.pixels[pixel_index] = _PIXEL_RED
+            tile = 0
+            new_text = _NOT_FED
 
-            if self.morning_sprite and self.morning_sprite[0] != 0:
-                self.morning_sprite[0] = 0
-                changed = True
+        if sprite and sprite[0] != tile:
+            sprite[0] = tile
+            changed = True
 
-            if self.morning_sprite_label and self.morning_sprite_label.text != "Not fed":
-                self.morning_sprite_label.text = "Not fed"
-                changed = True
+        if sprite_label and self._label_text.get(pixel_index) != new_text:
+            sprite_label.text = new_text
+            self._label_text[pixel_index] = new_text
+            changed = True
 
+        self._dirty |= changed
         return changed
 
-    def _update_evening(self, status):
-        """Update evening display and return True if changed"""
-        changed = False
-
-        if status:
-            # Fed - green light, filled bowl
-            self.pixels[Config.EVENING_PIXEL] = Config.PIXEL_GREEN
+    def _fed_label(self, status, pixel_index):
+        """Label text for a fed panel, rebuilt only when the timestamp changes"""
+        if not isinstance(status, str):
+            # True (or any non-timestamp value) - fed, time unknown
+            return _FED
 
-            if self.evening_sprite and self.evening_sprite[0] != 1:
-                self.evening_sprite[0] = 1
-                changed = True
+        cached = self._fed_text.get(pixel_index)
+        if cached and cached[0] == status:
+            return cached[1]
 
-            if self.evening_sprite_label:
-                new_text = f"Fed at {self._parse_time(status)}" if status != True else "Fed"
-                if self.evening_sprite_label.text != new_text:
-                    self.evening_sprite_label.text = new_text
-                    changed = True
-        else:
-            # Not fed - red light, empty bowl
-            self.pixels[Config.EVENING_PIXEL] = Config.PIXEL_RED
+        text = f"Fed at {_parse_time(status)}"
+        self._fed_text[pixel_index] = (status, text)
+        return text
 
-            if self.evening_sprite and self.evening_sprite[0] != 0:
-                self.evening_sprite[0] = 0
-                changed = True
+    @property
+    def last_status(self):
+        """(morning, evening) status last applied, or None if unknown"""
+        return self._last_status
 
-            if self.evening_sprite_label and self.evening_sprite_label.text != "Not fed":
-                self.evening_sprite_label.text = "Not fed"
-                changed = True
+    @property
+    def needs_refresh(self):
+        """True if the display objects changed since the panel was last refreshed"""
+        return self._dirty
 
-        return changed
+    def forget_status(self):
+        """Drop the cached status so the next update is applied in full"""
+        self._last_status = None
 
-    def _parse_time(self, timestamp_str):
-        """
-        Parse ISO8601 UTC timestamp and convert to local time in 12-hour format
-        Input: "2025-08-23T14:26:25Z" (UTC)
-        Output: "9:26 AM" (local time with timezone offset applied)
-        """
-        if not timestamp_str or timestamp_str == True:
+    def refresh_display(self):
+        """Refresh the e-ink display if the panel is ready for it"""
+        if self._refreshed and not self._dirty:
+            # Nothing drawn since the last refresh, the panel already shows it
+            print("Display unchanged since last refresh, skipping")
+            return
+
+        wait = board.DISPLAY.time_to_refresh
+        if wait > 0:
+            # Still marked dirty, the main loop retries once the panel is ready
+            print(f"Deferring refresh, too soon (ready in {wait:.1f}s)")
+            return
+
+        print("Refreshing display...")
+        board.DISPLAY.refresh()
+        self._shown_status = self._last_status
+        self._dirty = False
+        self._refreshed = True
+        print("Display refreshed")
+
+    def save_status(self):
+        """Store the status shown on the panel in sleep memory"""
+        if not self._refreshed:
+            # Panel untouched this boot, so the saved record is still right
+            return
+
+        data = json.dumps(self._shown_status).encode() if self._shown_status else b""
+        if len(data) > 255:
+            data = b""
+
+        offset = Config.SLEEP_MEMORY_STATUS
+        alarm.sleep_memory[offset] = len(data)
+        alarm.sleep_memory[offset + 1:offset + 1 + len(data)] = data
+
+    def saved_status(self):
+        """(morning, evening) saved before deep sleep, or None if there isn't one"""
+        offset = Config.SLEEP_MEMORY_STATUS
+        length = alarm.sleep_memory[offset]
+        if not length:
             return None
 
         try:
-            if 'T' in str(timestamp_str):
-                # ISO8601 format - extract date and time parts
-                date_part, time_part = timestamp_str.split('T')
-                time_part = time_part.split('.')[0].split('Z')[0]  # Remove fractional seconds and Z
-
-                hour_str, minute_str = time_part.split(':')[:2]
-                utc_hour = int(hour_str)
-                minute = int(minute_str)
+            morning, evening = json.loads(
+                bytes(alarm.sleep_memory[offset + 1:offset + 1 + length])
+            )
+        except (ValueError, TypeError) as e:
+            print(f"Could not read saved status: {e}")
+            return None
+        return (morning, evening)
 
-                # Convert UTC to local time by adding timezone offset
-                # e.g., if offset is -5 (EST), local = UTC - 5
-                local_hour = utc_hour + Config.TIMEZONE_OFFSET
-
-                # Handle day boundary (we only care about hour for display)
-                if local_hour >= 24:
-                    local_hour -= 24
-                elif local_hour < 0:
-                    local_hour += 24
-
-                # Convert to 12-hour format with AM/PM
-                if local_hour == 0:
-                    display_hour = 12
-                    period = "AM"
-                elif local_hour < 12:
-                    display_hour = local_hour
-                    period = "AM"
-                elif local_hour == 12:
-                    display_hour = 12
-                    period = "PM"
-                else:
-                    display_hour = local_hour - 12
-                    period = "PM"
-
-                return f"{display_hour}:{minute:02d} {period}"
-
-            # Fallback for non-ISO formats
-            return str(timestamp_str)
+    def restore_status(self):
+        """
+        Apply the status saved before deep sleep without refreshing
+        The e-ink panel still shows it, so only the in-memory display
+        objects and LEDs need to catch up.
+        Returns: True if a saved status was restored
+        """
+        status = self.saved_status()
+        if status is None:
+            return False
 
-        except Exception as e:
-            print(f"Error parsing time '{timestamp_str}': {e}")
-            return str(timestamp_str)
+        self._apply(status)
 
-    def refresh_display(self):
-        """Safely refresh the e-ink display with rate limiting"""
-        current_time = time.monotonic()
-
-        if current_time - self.last_refresh >= Config.DISPLAY_REFRESH_MIN_INTERVAL:
-            try:
-                print("Refreshing display...")
-                board.DISPLAY.refresh()
-                self.last_refresh = current_time
-                print("Display refreshed")
-            except RuntimeError as e:
-                if "too soon" in str(e).lower():
-                    print(f"Display refresh skipped: {e}")
-                else:
-                    raise
-        else:
-            time_since = current_time - self.last_refresh
-            print(f"Skipping refresh, too soon (last: {time_since:.1f}s ago)")
+        self._last_status = status
+        self._shown_status = self._last_status
+        self._dirty = False  # The panel already shows it
+        self.first_update = False
+        print("Restored display status from before deep sleep")
+        return True
 
     def shutdown(self):
         """Turn off LEDs before sleep (display persists on e-ink)"""
         print("Turning off LEDs for sleep mode...")
-        # Turn off all pixels explicitly
-        for i in range(Config.PIXEL_COUNT):
-            self.pixels[i] = Config.PIXEL_OFF
         self.pixels.fill(Config.PIXEL_OFF)
         self.pixels.brightness = 0  # Set brightness to 0 as well
         self.pixels.show()
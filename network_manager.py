@@ -3,18 +3,128 @@ Network Manager for Dog Feeding Tracker
 Handles WiFi, MQTT, and HTTP API communications
 """
 
-import os
+import random
 import ssl
 import time
 import wifi
 import socketpool
 import rtc
-import adafruit_ntp
-import adafruit_minimqtt.adafruit_minimqtt as MQTT
 import adafruit_requests
 from config import Config
 
 
+# Returned by _scan_value when a key isn't there (as opposed to null)
+_MISSING = object()
+
+
+def _skip_space(body, idx, end):
+    """Index of the first non-whitespace byte at or after idx"""
+    while idx < end and body[idx] in b' \t\r\n':
+        idx += 1
+    return idx
+
+
+def _find_key(body, key, start, end):
+    """
+    Find a JSON key between start and end, only where it is followed by a
+    colon (so a string value that happens to equal the key is skipped)
+    Returns: Index just past the colon, or -1
+    """
+    idx = body.find(key, start)
+    while 0 <= idx < end:
+        after = _skip_space(body, idx + len(key), end)
+        if body[after:after + 1] == b':':
+            return after + 1
+        idx = body.find(key, idx + len(key))
+    return -1
+
+
+def _scan_value(body, key, start, end):
+    """
+    Find a JSON key in raw bytes and return its value without a full parse
+    Strings are returned decoded, true as True, anything else as None,
+    and _MISSING if the key isn't between start and end
+    """
+    idx = _find_key(body, key, start, end)
+    if idx < 0:
+        return _MISSING
+    idx = _skip_space(body, idx, end)
+
+    if body[idx:idx + 1] == b'"':
+        close = body.find(b'"', idx + 1)
+        if close < 0:
+            return None
+        return body[idx + 1:close].decode() or None
+    if body[idx:idx + 4] == b'true':
+        return True
+    return None
+
+
+def _scan_status(body):
+    """
+    Scan (morning, evening) out of a raw {"dog_feed_status": {...}} body
+    Returns: tuple, or None if the object or both of its keys are missing
+    """
+    idx = _find_key(body, b'"dog_feed_status"', 0, len(body))
+    if idx < 0:
+        return None
+    idx = _skip_space(body, idx, len(body))
+    if body[idx:idx + 1] != b'{':
+        # null (or anything else that isn't an object)
+        return None
+    end = body.find(b'}', idx)
+    if end < 0:
+        return None
+
+    morning = _scan_value(body, b'"morning"', idx, end)
+    evening = _scan_value(body, b'"evening"', idx, end)
+    if morning is _MISSING and evening is _MISSING:
+        return None
+    return (
+        None if morning is _MISSING else morning,
+        None if evening is _MISSING else evening
+    )
+
+
+# Zero-padded two digit strings for timestamp fields (0-59)
+_TWO = tuple("%02d" % i for i in range(60))
+
+# Month abbreviations in HTTP Date header order
+_MONTHS = "JanFebMarAprMayJunJulAugSepOctNovDec"
+
+
+def _parse_http_date(value):
+    """
+    Parse an HTTP Date header into UTC epoch seconds
+    Input: "Sat, 23 Aug 2025 14:26:25 GMT"
+    Returns: seconds, or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        _, day, month, year, clock = value.split()[:5]
+        month_index = _MONTHS.find(month)
+        if month_index < 0:
+            return None
+        return time.mktime((
+            int(year), month_index // 3 + 1, int(day),
+            int(clock[0:2]), int(clock[3:5]), int(clock[6:8]),
+            0, 0, -1
+        ))
+    except (ValueError, IndexError):
+        return None
+
+
+def _host_port(url):
+    """(host, port) from an http:// or https:// URL"""
+    default_port = 443 if url.startswith("https:") else 80
+    host = url.split("://", 1)[-1].split("/", 1)[0]
+    if ":" in host:
+        host, port = host.split(":", 1)
+        return host, int(port)
+    return host, default_port
+
+
 class NetworkManager:
     """Manages all network communications"""
 
@@ -26,6 +136,12 @@ class NetworkManager:
         self.mqtt_connected = False
         self.connection_failures = 0
         self.on_feeding_trigger = on_feeding_trigger
+        self._ntp = None
+        self._ssl_context = None  # Created on first use, see _get_ssl_context
+        self._rtc = rtc.RTC()  # Singleton wrapper, created once
+        self._http_buf = bytearray(Config.HTTP_BUFFER_SIZE)  # Reused by every fetch
+        self._date_synced = False  # RTC set from an HTTP Date header since last sync_time()
+        self._p_fail = 0.0  # Moving average of attempt failures, widens backoff
 
     def connect_wifi(self, max_attempts=Config.MAX_RETRIES):
         """
@@ -37,15 +153,11 @@ class NetworkManager:
                 if wifi.radio.connected:
                     print(f"WiFi connected! IP: {wifi.radio.ipv4_address}")
                     self.connection_failures = 0
+                    self._record_attempt(False)
 
-                    # Create socket pool
-                    self.pool = socketpool.SocketPool(wifi.radio)
-
-                    # Initialize requests session
-                    self.requests = adafruit_requests.Session(
-                        self.pool,
-                        ssl.create_default_context()
-                    )
+                    # Socket pool and requests session are built once and
+                    # kept across reconnects
+                    self._ensure_session()
 
                     # Show network info
                     if wifi.radio.ap_info:
@@ -55,17 +167,60 @@ class NetworkManager:
                     return True
                 else:
                     print(f"Waiting for WiFi (attempt {attempt + 1}/{max_attempts})...")
+                    self._record_attempt(True)
                     time.sleep(2)
 
             except Exception as e:
                 print(f"WiFi error: {e}")
+                self._record_attempt(True)
                 if attempt < max_attempts - 1:
-                    time.sleep(Config.RETRY_DELAY)
+                    self._backoff_sleep(attempt)
 
         self.connection_failures += 1
         print("Failed to connect to WiFi")
         return False
 
+    def _ensure_pool(self):
+        """Socket pool for the WiFi radio, created on first use"""
+        if self.pool is None:
+            self.pool = socketpool.SocketPool(wifi.radio)
+        return self.pool
+
+    def _ensure_session(self):
+        """
+        Requests session, created on first use so pooled sockets are reused
+        across status fetches and reconnects. The SSL context is only built
+        when the API actually uses HTTPS
+        """
+        if self.requests is None:
+            https = Config.DOG_FEED_STATUS_URL.startswith("https:")
+            self.requests = adafruit_requests.Session(
+                self._ensure_pool(),
+                self._get_ssl_context() if https else None
+            )
+        return self.requests
+
+    def _get_ssl_context(self):
+        """Shared SSL context (loading the CA bundle is slow, so do it once)"""
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _record_attempt(self, failed):
+        """Fold one network attempt into the failure rate average"""
+        weight = Config.RETRY_FAILURE_WEIGHT
+        self._p_fail = (1 - weight) * self._p_fail + (weight if failed else 0)
+
+    def _backoff_sleep(self, attempt):
+        """
+        Wait before retry number attempt + 1 (exponential backoff, full jitter)
+        A random wait within the window keeps devices that failed together
+        from retrying in lockstep. The window grows with the recent failure
+        rate (up to 2x), so a flaky network is retried less aggressively
+        """
+        window = Config.RETRY_BASE * (1 << attempt) * (1 + self._p_fail)
+        time.sleep(random.random() * min(Config.RETRY_CAP, window))
+
     def ensure_wifi_connected(self):
         """Check and maintain WiFi connection"""
         if not wifi.radio.connected:
@@ -74,16 +229,33 @@ class NetworkManager:
         return True
 
     def sync_time(self):
+        """
+        Set the RTC to local time via NTP
+        Returns: True if the RTC was updated
+        """
+        if self._date_synced:
+            # Status fetches already kept the clock current
+            self._date_synced = False
+            print("Time already set from the status API, skipping NTP")
+            return True
+
         print("Syncing time via NTP...")
 
         try:
-            pool = socketpool.SocketPool(wifi.radio)
-            ntp = adafruit_ntp.NTP(pool, server="pool.ntp.org", tz_offset=Config.TIMEZONE_OFFSET)
-            now = ntp.datetime
+            if self._ntp is None:
+                # Imported on first use: wakes that skip NTP never load it
+                import adafruit_ntp  # pylint: disable=import-outside-toplevel
+
+                self._ntp = adafruit_ntp.NTP(
+                    self._ensure_pool(),
+                    server="pool.ntp.org",
+                    tz_offset=Config.TIMEZONE_OFFSET
+                )
+            now = self._ntp.datetime
 
             print("Raw NTP time:", now)
 
-            rtc.RTC().datetime = now
+            self._rtc.datetime = now
             print("NTP sync OK")
             return True
 
@@ -96,44 +268,104 @@ class NetworkManager:
     def fetch_dog_feed_status(self):
         """
         Fetch feeding status from REST API
-        Returns: Dict with 'morning' and 'evening' keys or None
+        Returns: (morning, evening) tuple or None
         """
-        if not self.ensure_wifi_connected():
+        if not self.ensure_wifi_connected() or not self.requests:
             return None
 
-        for attempt in range(Config.MAX_RETRIES):
-            try:
-                if not self.requests:
-                    return None
+        # Bind settings used on every attempt once
+        max_retries = Config.MAX_RETRIES
+        url = Config.DOG_FEED_STATUS_URL
+        timeout = Config.HTTP_TIMEOUT
 
-                print(f"Fetching status (attempt {attempt + 1}/{Config.MAX_RETRIES})...")
+        for attempt in range(max_retries):
+            try:
+                print(f"Fetching status (attempt {attempt + 1}/{max_retries})...")
                 response = self.requests.get(
-                    Config.DOG_FEED_STATUS_URL,
-                    timeout=Config.HTTP_TIMEOUT
+                    url,
+                    timeout=timeout,
+                    stream=True
                 )
 
-                if response.status_code == 200:
-                    data = response.json()
-                    status = data.get('dog_feed_status', {})
-
-                    # Log status
-                    morning = "Yes" if status.get('morning') else "No"
-                    evening = "Yes" if status.get('evening') else "No"
-                    print(f"Status: Morning fed: {morning}, Evening fed: {evening}")
-
-                    return status
-                else:
-                    print(f"API returned status: {response.status_code}")
-                    if response.text:
-                        print(f"Response: {response.text[:200]}")
+                try:
+                    ok = response.status_code == 200
+                    self._record_attempt(not ok)
+                    if ok:
+                        # Scan the two values out of the raw body instead of
+                        # building a dict of strings with response.json()
+                        status = _scan_status(self._read_body(response))
+                        if status is None:
+                            # Retrying won't change the payload
+                            print("Status response has no dog_feed_status values")
+                            return None
+
+                        if Config.HTTP_DATE_TIME_SYNC:
+                            self._sync_time_from_date(response.headers.get('date'))
+
+                        # Log status
+                        morning = "Yes" if status[0] else "No"
+                        evening = "Yes" if status[1] else "No"
+                        print(f"Status: Morning fed: {morning}, Evening fed: {evening}")
+
+                        return status
+                    else:
+                        # Don't read the body: an error page may not fit in RAM
+                        length = response.headers.get('content-length', 'unknown')
+                        print(f"API returned status: {response.status_code} (body: {length} bytes)")
+                finally:
+                    # Return the socket to the pool and free the body buffer
+                    response.close()
 
             except Exception as e:
                 print(f"Error fetching status: {e}")
-                if attempt < Config.MAX_RETRIES - 1:
-                    time.sleep(Config.RETRY_DELAY)
+                self._record_attempt(True)
+                if attempt < max_retries - 1:
+                    # Keep MQTT serviced while backing off (callbacks only
+                    # record triggers, so this can't re-enter the fetch)
+                    if self.mqtt_connected:
+                        self.loop_mqtt()
+                    self._backoff_sleep(attempt)
 
         return None
 
+    def _sync_time_from_date(self, value):
+        """Set the RTC (local time) from an HTTP Date header, if it parses"""
+        utc_seconds = _parse_http_date(value)
+        if utc_seconds is None:
+            return
+        self._rtc.datetime = time.localtime(utc_seconds + Config.TIMEZONE_OFFSET * 3600)
+        self._date_synced = True
+
+    def _read_body(self, response):
+        """
+        Read a response body, through the shared HTTP buffer when it fits
+        Returns: The body as bytes
+        """
+        buf = self._http_buf
+        view = memoryview(buf)
+        length = 0
+
+        # Response._readinto is private to adafruit_requests (4.1.15 in lib/);
+        # it decodes Content-Length and chunked bodies into a caller's buffer.
+        # Re-check this when updating the library
+        readinto = response._readinto  # pylint: disable=protected-access
+
+        while length < len(buf):
+            count = readinto(view[length:])
+            if not count:
+                return bytes(view[:length])
+            length += count
+
+        # Buffer full: one more read tells an exact fit from a larger body
+        extra = bytearray(1)
+        if not readinto(extra):
+            return bytes(buf)
+
+        # Too big for the buffer; content continues from where _readinto
+        # stopped, so join the remainder on (allocates, but still works)
+        print(f"Status response larger than {len(buf)} bytes, reading the rest")
+        return bytes(buf) + extra + response.content
+
     def setup_mqtt(self):
         """Initialize MQTT client"""
         if not self.pool:
@@ -142,22 +374,22 @@ class NetworkManager:
 
         print("Setting up MQTT client...")
 
-        # Get MQTT settings from environment
-        mqtt_broker = os.getenv("MQTT_BROKER", "192.168.1.85")
-        mqtt_port = int(os.getenv("MQTT_PORT", "1883"))
-        mqtt_username = os.getenv("MQTT_USERNAME")
-        mqtt_password = os.getenv("MQTT_PASSWORD")
+        # Imported on first use: SLEEP_BETWEEN_FETCHES runs never load it
+        # pylint: disable-next=import-outside-toplevel
+        import adafruit_minimqtt.adafruit_minimqtt as MQTT
 
-        print(f"MQTT Broker: {mqtt_broker}:{mqtt_port}")
+        print(f"MQTT Broker: {Config.MQTT_BROKER}:{Config.MQTT_PORT}")
 
         self.mqtt_client = MQTT.MQTT(
-            broker=mqtt_broker,
-            port=mqtt_port,
-            username=mqtt_username,
-            password=mqtt_password,
+            broker=Config.MQTT_BROKER,
+            port=Config.MQTT_PORT,
+            username=Config.MQTT_USERNAME,
+            password=Config.MQTT_PASSWORD,
             socket_pool=self.pool,
             is_ssl=False,
-            keep_alive=60
+            keep_alive=60,
+            socket_timeout=Config.MQTT_SOCKET_TIMEOUT,
+            recv_timeout=Config.MQTT_RECV_TIMEOUT
         )
 
         # Set callbacks
@@ -193,10 +425,16 @@ class NetworkManager:
             return False
 
     def loop_mqtt(self):
-        """Process MQTT messages"""
+        """Process all pending MQTT messages without blocking for long"""
         if self.mqtt_client and self.mqtt_connected:
             try:
-                self.mqtt_client.loop(timeout=Config.MQTT_LOOP_TIMEOUT)
+                # Each loop() returns quickly when idle; keep going while it
+                # processes packets so bursts don't back up between passes
+                loop = self.mqtt_client.loop
+                timeout = Config.MQTT_LOOP_TIMEOUT
+                for _ in range(Config.MQTT_DRAIN_LIMIT):
+                    if not loop(timeout=timeout):
+                        break
             except Exception as e:
                 print(f"MQTT loop error: {e}")
                 self.mqtt_connected = False
@@ -206,13 +444,15 @@ class NetworkManager:
             return self.connect_mqtt()
         return False
 
-    def publish_feeding_status(self, topic, fed=True):
+    def publish_feeding_status(self, topic, fed=True, qos=0, retain=False):
         """
         Publish feeding status to MQTT topic
 
         Args:
             topic: MQTT topic to publish to
             fed: True for fed (sends ISO8601 UTC timestamp), False for not fed
+            qos: MQTT QoS level (0 avoids waiting for PUBACK)
+            retain: Ask the broker to keep this as the topic's last value
 
         Returns: True if published successfully
         """
@@ -221,9 +461,10 @@ class NetworkManager:
             return False
 
         if not self.mqtt_connected:
-            print("MQTT not connected, attempting reconnect...")
-            if not self.connect_mqtt():
-                return False
+            # Reconnecting blocks for seconds; leave it to loop_mqtt() in the
+            # main loop rather than stalling the caller
+            print("MQTT not connected, not publishing")
+            return False
 
         try:
             # Determine message payload
@@ -235,8 +476,8 @@ class NetworkManager:
                 message = getattr(Config, 'MQTT_NOT_FED_PAYLOAD', '')
 
             print(f"Publishing to {topic}: {message}")
-            self.mqtt_client.publish(topic, message)
-            print(f"Published successfully")
+            self.mqtt_client.publish(topic, message, retain=retain, qos=qos)
+            print("Published successfully")
             return True
 
         except Exception as e:
@@ -251,51 +492,16 @@ class NetworkManager:
 
         RTC is set to local time, so we convert back to UTC by subtracting the offset
         """
-        current = rtc.RTC().datetime
-
-        # Get local time components
-        year = current.tm_year
-        month = current.tm_mon
-        day = current.tm_mday
-        hour = current.tm_hour
-        minute = current.tm_min
-        second = current.tm_sec
-
-        # Convert local time to UTC by subtracting timezone offset
-        # e.g., if offset is -5 (EST), UTC = local + 5
-        utc_hour = hour - Config.TIMEZONE_OFFSET
-
-        # Handle day rollover
-        if utc_hour >= 24:
-            utc_hour -= 24
-            day += 1
-            # Handle month rollover (simplified - assumes 28-31 days)
-            days_in_month = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-            # Simple leap year check
-            if month == 2 and (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)):
-                days_in_month[2] = 29
-            if day > days_in_month[month]:
-                day = 1
-                month += 1
-                if month > 12:
-                    month = 1
-                    year += 1
-        elif utc_hour < 0:
-            utc_hour += 24
-            day -= 1
-            if day < 1:
-                month -= 1
-                if month < 1:
-                    month = 12
-                    year -= 1
-                days_in_month = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-                if month == 2 and (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)):
-                    days_in_month[2] = 29
-                day = days_in_month[month]
-
-        # Format as ISO8601 UTC: "2025-08-23T14:26:25Z"
-        timestamp = f"{year:04d}-{month:02d}-{day:02d}T{utc_hour:02d}:{minute:02d}:{second:02d}Z"
-        return timestamp
+        # Shift in epoch seconds so day/month/year rollover comes for free
+        local_seconds = time.mktime(self._rtc.datetime)
+        utc = time.localtime(local_seconds - Config.TIMEZONE_OFFSET * 3600)
+
+        # Format as ISO8601 UTC: "2025-08-23T14:26:25Z" (table lookups
+        # instead of format specs)
+        return (
+            str(utc.tm_year) + "-" + _TWO[utc.tm_mon] + "-" + _TWO[utc.tm_mday]
+            + "T" + _TWO[utc.tm_hour] + ":" + _TWO[utc.tm_min] + ":" + _TWO[utc.tm_sec] + "Z"
+        )
 
     def disconnect_mqtt(self):
         """Disconnect MQTT client"""
@@ -312,9 +518,11 @@ class NetworkManager:
         print(f"Connected to MQTT Broker! (RC: {rc})")
         self.mqtt_connected = True
 
-        # Subscribe to topics
-        client.subscribe(Config.MQTT_MORNING_TOPIC)
-        client.subscribe(Config.MQTT_EVENING_TOPIC)
+        # Subscribe to both topics in one SUBSCRIBE packet (single SUBACK)
+        client.subscribe([
+            (Config.MQTT_MORNING_TOPIC, 0),
+            (Config.MQTT_EVENING_TOPIC, 0),
+        ])
         print("Subscribed to feeding topics")
 
     def _on_mqtt_disconnect(self, client, userdata, rc):
@@ -335,25 +543,31 @@ class NetworkManager:
             self.on_feeding_trigger(topic, message)
 
     def test_connectivity(self):
-        """Test network connectivity to various endpoints"""
-        if not self.requests:
-            print("Requests session not initialized")
+        """Test network connectivity to various endpoints (TCP connect only)"""
+        if not self.pool:
+            print("Socket pool not initialized")
             return
 
         print("\n=== Testing Network Connectivity ===")
 
-        mqtt_broker = os.getenv("MQTT_BROKER", "192.168.1.85")
-
-        test_urls = [
-            ("Dog Feed API", Config.DOG_FEED_STATUS_URL),
-            ("MQTT HTTP", f"http://{mqtt_broker}:1880/")
-        ]
+        api_host, api_port = _host_port(Config.DOG_FEED_STATUS_URL)
+        targets = (
+            ("Dog Feed API", api_host, api_port),
+            ("MQTT Broker", Config.MQTT_BROKER, Config.MQTT_PORT)
+        )
 
-        for name, url in test_urls:
+        for name, host, port in targets:
             try:
-                print(f"Testing {name}: {url}")
-                response = self.requests.get(url, timeout=5)
-                print(f"  ✓ {name} reachable (status: {response.status_code})")
+                print(f"Testing {name}: {host}:{port}")
+                address = self.pool.getaddrinfo(host, port)[0][4]
+                sock = self.pool.socket(self.pool.AF_INET, self.pool.SOCK_STREAM)
+                try:
+                    # A completed handshake is enough, no request is sent
+                    sock.settimeout(2)
+                    sock.connect(address)
+                    print(f"  ✓ {name} reachable")
+                finally:
+                    sock.close()
             except Exception as e:
                 print(f"  ✗ {name} not reachable: {e}")
 
@@ -0,0 +1,464 @@
+"""
+Dog Feeding Tracker for Adafruit MagTag
+Application module - coordinates all components (started from code.py)
+CircuitPython 10.x compatible
+"""
+
+import gc
+import sys
+import time
+import alarm
+import board
+import microcontroller
+import supervisor
+
+from config import Config
+from display_manager import DisplayManager
+from network_manager import NetworkManager
+from button_manager import ButtonManager
+
+# Compact the heap after module loading, before long-lived objects are created
+gc.collect()
+
+# supervisor.ticks_ms() wraps at 2**29; these give wrap-safe differences
+_TICKS_PERIOD = 1 << 29
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+
+def ticks_diff(end, start):
+    """Signed milliseconds from start to end (supervisor.ticks_ms() values)"""
+    diff = (end - start) & _TICKS_MAX
+    return ((diff + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+
+def is_due(now, last, interval):
+    """True if interval seconds have passed since tick last (None = never ran)"""
+    return last is None or ticks_diff(now, last) > interval * 1000
+
+
+def save_last_sync():
+    """Record the time of a successful NTP sync in sleep memory"""
+    offset = Config.SLEEP_MEMORY_LAST_SYNC
+    alarm.sleep_memory[offset:offset + 4] = int(time.time()).to_bytes(4, "little")
+
+
+def synced_recently():
+    """True if the RTC was synced within TIME_SYNC_INTERVAL before deep sleep"""
+    offset = Config.SLEEP_MEMORY_LAST_SYNC
+    last = int.from_bytes(bytes(alarm.sleep_memory[offset:offset + 4]), "little")
+    return last and 0 <= time.time() - last < Config.TIME_SYNC_INTERVAL
+
+
+def is_today(timestamp):
+    """
+    True if an ISO8601 UTC timestamp falls on today's local date
+    Input: "2025-08-23T14:26:25Z" (fixed-width date and time fields)
+    """
+    try:
+        utc_seconds = time.mktime((
+            int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+            int(timestamp[11:13]), int(timestamp[14:16]), 0,
+            0, 0, -1
+        ))
+    except (ValueError, OverflowError):
+        return False
+    # The RTC runs on local time, so compare local dates
+    stamp = time.localtime(utc_seconds + Config.TIMEZONE_OFFSET * 3600)
+    today = time.localtime()
+    return (stamp.tm_year, stamp.tm_yday) == (today.tm_year, today.tm_yday)
+
+
+class DogFeedingTracker:
+    """Main application class"""
+
+    def __init__(self, woke_from_sleep=False):
+        """Initialize the tracker"""
+        # Components are long-lived, so allocate them before any short-lived
+        # strings and compact in between to keep the heap unfragmented
+        gc.collect()
+        self.display = DisplayManager()
+        gc.collect()
+        self.network = NetworkManager(on_feeding_trigger=self.on_feeding_trigger)
+        gc.collect()
+        self.buttons = ButtonManager(self.network, self.display)
+        gc.collect()
+
+        print("\n=== Dog Feeding Tracker Starting ===")
+        print(f"CircuitPython {'.'.join(map(str, sys.implementation.version))}")
+
+        # Track if we woke from deep sleep
+        self.woke_from_sleep = woke_from_sleep
+
+        # Timing (supervisor.ticks_ms() when each periodic task last ran)
+        self.last_sync = None
+        self.last_status_fetch = None
+        self.last_sleep_check = None
+
+        # Work requested by MQTT callbacks, serviced from the main loop
+        self._trigger_status = None  # (morning, evening) from message payloads
+        self._trigger_fetch = False  # A payload couldn't be used, ask the API
+        self._prefetched_status = None  # Fetched by check_unchanged_on_wake()
+
+        # Set by check_unchanged_on_wake() so setup() doesn't repeat its
+        # retries on the same wake
+        self._wake_fetch_done = False  # Fetch attempted, use _prefetched_status
+        self._wake_offline = False  # WiFi didn't connect, skip network setup
+
+    def on_feeding_trigger(self, topic, message):
+        """Handle MQTT feeding trigger (only records it, see _service_trigger)"""
+        # Use the payload directly when possible, avoiding an API round trip
+        status = self._status_from_message(topic, message)
+        if status:
+            self._trigger_status = status
+        else:
+            self._trigger_fetch = True
+
+    def _service_trigger(self):
+        """Apply MQTT triggers received since the last pass with one refresh"""
+        status = self._trigger_status
+        if self._trigger_fetch:
+            # Clear the request first: the fetch services MQTT while backing
+            # off, so new triggers can be recorded while it runs
+            self._trigger_fetch = False
+            # Fetch latest status from API (collect first to free room for the body)
+            gc.collect()
+            fetched = self.network.fetch_dog_feed_status()
+            if self._trigger_status is not status:
+                # A message arrived during the fetch (merged on top of the
+                # pending trigger); it is newer than the API's answer
+                status = self._trigger_status
+            elif fetched:
+                status = fetched
+            else:
+                print("Failed to fetch status after MQTT trigger")
+
+        self._trigger_status = None
+        if status:
+            # Force refresh on MQTT trigger
+            gc.collect()
+            self.display.update_status(status[0], status[1], force_refresh=True)
+
+    def _status_from_message(self, topic, message):
+        """
+        Merge an MQTT feeding message into the last known status
+        Returns: (morning, evening) tuple, or None if the payload can't be used
+        """
+        # Build on triggers not yet applied so a burst of messages isn't lost
+        last = self._trigger_status or self.display.last_status
+        if last is None:
+            return None
+
+        payload = str(message).strip()
+        if payload == Config.MQTT_NOT_FED_PAYLOAD or payload.lower() in ("", "false", "null", "none"):
+            value = None
+        elif payload.lower() == "true":
+            value = True
+        elif len(payload) >= 16 and payload[10] == 'T':
+            # ISO8601 timestamp, same format the status API returns. Fed
+            # timestamps are published retained, so the broker replays the
+            # last one on every (re)connect; only trust today's, and let the
+            # API settle anything older
+            if not is_today(payload):
+                return None
+            value = payload
+        else:
+            return None
+
+        if topic == Config.MQTT_MORNING_TOPIC:
+            return (value, last[1])
+        if topic == Config.MQTT_EVENING_TOPIC:
+            return (last[0], value)
+        return None
+
+    def check_sleep_schedule(self):
+        """Check if device should enter deep sleep"""
+        # Bind the window bounds once (local loads are cheaper than Config.X)
+        morning_start = Config.MORNING_START
+        morning_end = Config.MORNING_END
+        evening_start = Config.EVENING_START
+        evening_end = Config.EVENING_END
+
+        current = time.localtime()
+        hour = current.tm_hour
+
+        if Config.DEBUG:
+            print(f"Sleep check - Time: {hour:02d}:{current.tm_min:02d}:{current.tm_sec:02d}", end="")
+            print(
+                f" (Hours: Morning {morning_start}-{morning_end}, Evening {evening_start}-{evening_end})")
+
+        # Common case: inside a feeding window, nothing to schedule
+        if morning_start <= hour < morning_end or evening_start <= hour < evening_end:
+            return
+
+        # Current time as seconds since midnight
+        seconds_today = hour * 3600 + current.tm_min * 60 + current.tm_sec
+
+        seconds_to_sleep = 0
+        sleep_reason = ""
+
+        if hour < morning_start:
+            # Before morning window
+            seconds_to_sleep = morning_start * 3600 - seconds_today
+            sleep_reason = "before morning window"
+
+        elif morning_end <= hour < evening_start:
+            # Between windows
+            seconds_to_sleep = evening_start * 3600 - seconds_today
+            sleep_reason = "between feeding windows"
+
+        elif hour >= evening_end:
+            # After evening window, wake at tomorrow's morning start
+            seconds_to_sleep = 86400 - seconds_today + morning_start * 3600
+            sleep_reason = "after evening window"
+
+        if seconds_to_sleep > 60:  # Only sleep if more than 1 minute
+            self.enter_deep_sleep(seconds_to_sleep, sleep_reason)
+
+    def enter_deep_sleep(self, seconds, reason):
+        """Enter deep sleep mode"""
+        hours = seconds / 3600
+        print(f"\n{'=' * 50}")
+        print("ENTERING DEEP SLEEP")
+        print(f"Reason: {reason}")
+        print(f"Duration: {hours:.1f} hours ({seconds:.0f} seconds)")
+        print("Display will remain visible, LEDs will turn off")
+        print(f"{'=' * 50}\n")
+
+        # Remember what the panel shows so the next wake can skip a refresh
+        self.display.save_status()
+
+        # Turn off LEDs only (display persists on e-ink)
+        self.display.shutdown()
+
+        # Give LEDs time to actually turn off
+        time.sleep(0.5)
+
+        # Disconnect network
+        print("Disconnecting network...")
+        self.network.disconnect_mqtt()
+
+        # Clean up memory
+        gc.collect()
+
+        print("Creating wake alarm and entering deep sleep NOW...")
+
+        # Create time alarm
+        time_alarm = alarm.time.TimeAlarm(
+            monotonic_time=time.monotonic() + seconds
+        )
+
+        # Enter deep sleep
+        alarm.exit_and_deep_sleep_until_alarms(time_alarm)
+
+    def setup(self):
+        """Initialize all components"""
+        # Show startup animation on power-on only; a wake should get to the
+        # status as quickly as possible
+        if not self.woke_from_sleep:
+            self.display.startup_animation()
+
+        # Setup display
+        self.display.setup()
+
+        # After deep sleep the panel still shows the last status; reload it
+        # before any network work so the LEDs are right straight away
+        restored = self.woke_from_sleep and self.display.restore_status()
+
+        # Connect to WiFi (unless the wake check just failed to; the next
+        # wake tries again rather than retrying and resetting now)
+        offline = self._wake_offline
+        if offline:
+            print("WiFi unavailable on this wake, skipping network setup")
+        elif not self.network.connect_wifi():
+            print("Failed to connect to WiFi, will retry after reset...")
+            time.sleep(30)
+            microcontroller.reset()
+
+        # Sync time (the RTC keeps running in deep sleep, so a recent sync
+        # from before sleeping is still good)
+        if self.woke_from_sleep and synced_recently():
+            print("Time synced recently, skipping NTP")
+            self.last_sync = supervisor.ticks_ms()
+        elif not offline and self.network.sync_time():
+            self.last_sync = supervisor.ticks_ms()
+            save_last_sync()
+        else:
+            print("Warning: Could not sync device time")
+
+        # Test connectivity (diagnostic only, costs a TCP connect per target)
+        if Config.DEBUG_CONNECTIVITY and not offline:
+            self.network.test_connectivity()
+
+        # Setup MQTT (not needed when the device sleeps right after fetching)
+        if not Config.SLEEP_BETWEEN_FETCHES and self.network.setup_mqtt():
+            self.network.connect_mqtt()
+
+        # Fetch initial status (already tried by the wake check, if it ran)
+        if self._wake_fetch_done or offline:
+            initial_status = self._prefetched_status
+        else:
+            print("\nFetching initial feeding status...")
+            initial_status = self.network.fetch_dog_feed_status()
+        self._prefetched_status = None
+        self.last_status_fetch = supervisor.ticks_ms()
+        if initial_status:
+            # Force refresh on startup, unless the panel already shows the
+            # status saved before sleep (then only changes trigger a refresh)
+            self.display.update_status(
+                initial_status[0],
+                initial_status[1],
+                force_refresh=not restored
+            )
+
+        # After deep sleep, make sure the panel matches the display objects
+        # (at most one refresh: skipped if the update above already did it)
+        if self.woke_from_sleep and not restored and self.display.needs_refresh:
+            print("Forcing refresh after deep sleep wake")
+            self.display.refresh_display()
+
+    def check_unchanged_on_wake(self):
+        """
+        Go straight back to sleep if the status matches what the panel shows
+        Used by SLEEP_BETWEEN_FETCHES wakes to skip building the display
+        """
+        saved = self.display.saved_status()
+        if saved is None:
+            return
+        if not self.network.connect_wifi():
+            self._wake_offline = True
+            return
+
+        status = self.network.fetch_dog_feed_status()
+        self._wake_fetch_done = True
+        if status != saved:
+            # Changed (or fetch failed), let setup() handle it normally
+            self._prefetched_status = status
+            return
+
+        print("Status unchanged since last wake, skipping display setup")
+        self.check_sleep_schedule()
+        self.enter_deep_sleep(Config.STATUS_FETCH_INTERVAL, "until next status fetch")
+
+    def poll_buttons(self, duration):
+        """Service button presses, flashes, and queued publishes for a while"""
+        start = supervisor.ticks_ms()
+        duration_ms = int(duration * 1000)
+        while ticks_diff(supervisor.ticks_ms(), start) < duration_ms:
+            self.buttons.check_buttons()
+            self.buttons.pump_flash()
+            self.buttons.pump()
+            time.sleep(Config.BUTTON_POLL_INTERVAL)
+
+    def run(self):
+        """Main application loop"""
+        if Config.SLEEP_BETWEEN_FETCHES and self.woke_from_sleep:
+            self.check_unchanged_on_wake()
+
+        self.setup()
+
+        if Config.SLEEP_BETWEEN_FETCHES:
+            # Single pass per wake: setup() fetched and showed the status, so
+            # sleep until the next window or the next scheduled fetch
+            self.check_sleep_schedule()
+            self.enter_deep_sleep(Config.STATUS_FETCH_INTERVAL, "until next status fetch")
+
+        print("\nEntering main loop...")
+        print("=" * 50)
+
+        # Intervals are fixed, bind them once outside the loop
+        sleep_check_interval = Config.SLEEP_CHECK_INTERVAL
+        time_sync_interval = Config.TIME_SYNC_INTERVAL
+        status_fetch_interval = Config.STATUS_FETCH_INTERVAL
+        gc_free_threshold = Config.GC_FREE_THRESHOLD
+        main_loop_wait = Config.MAIN_LOOP_WAIT
+
+        while True:
+            try:
+                now = supervisor.ticks_ms()
+
+                # Each periodic task runs when its own interval has elapsed
+                if is_due(now, self.last_sleep_check, sleep_check_interval):
+                    self.last_sleep_check = now
+                    self.check_sleep_schedule()
+
+                # Periodic time sync
+                if is_due(now, self.last_sync, time_sync_interval):
+                    if Config.DEBUG:
+                        print("\nSyncing device time...")
+                    if self.network.sync_time():
+                        self.last_sync = supervisor.ticks_ms()
+                        save_last_sync()
+
+                # Handle MQTT, then act on any triggers it delivered
+                self.network.loop_mqtt()
+                if self._trigger_status or self._trigger_fetch:
+                    self._service_trigger()
+
+                # Periodic status fetch
+                if is_due(now, self.last_status_fetch, status_fetch_interval):
+                    if Config.DEBUG:
+                        print("\nPeriodic status check...")
+                    gc.collect()
+                    status_data = self.network.fetch_dog_feed_status()
+                    if status_data:
+                        self.display.update_status(
+                            status_data[0],
+                            status_data[1],
+                            force_refresh=False
+                        )
+                    self.last_status_fetch = supervisor.ticks_ms()
+
+                # Retry a refresh dropped during the panel's cooldown (the
+                # same status won't trigger another update on its own)
+                if self.display.needs_refresh and board.DISPLAY.time_to_refresh == 0:
+                    self.display.refresh_display()
+
+                # Check connection health
+                if not self.network.check_connection_health():
+                    print("\nToo many connection failures, resetting...")
+                    microcontroller.reset()
+
+                # Safety net; regular collections happen before large allocations
+                if gc.mem_free() < gc_free_threshold:
+                    gc.collect()
+
+                # Service buttons until the next pass
+                # MQTT loop timeout already paces the cycle, so keep this short
+                self.poll_buttons(main_loop_wait)
+
+            except MemoryError as e:
+                print(f"Memory error: {e}")
+                gc.collect()
+                time.sleep(5)
+
+            except KeyboardInterrupt:
+                print("\n\nShutdown requested...")
+                self.display.shutdown()
+                self.network.disconnect_mqtt()
+                break
+
+            except Exception as e:
+                print(f"Main loop error: {e}")
+                time.sleep(5)
+
+
+def main():
+    """Entry point"""
+    # Check if waking from deep sleep
+    print("\n" + "=" * 50)
+    woke_from_sleep = False
+    if alarm.wake_alarm:
+        print("Woke from deep sleep!")
+        woke_from_sleep = True
+    else:
+        print("Fresh start (not from deep sleep)")
+
+    try:
+        tracker = DogFeedingTracker(woke_from_sleep=woke_from_sleep)
+        tracker.run()
+    except Exception as e:
+        print(f"Fatal error: {e}")
+        # Wait before reset to allow reading error
+        time.sleep(10)
+        microcontroller.reset()